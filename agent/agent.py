@@ -7,12 +7,16 @@ A simple ReAct-style agent with:
 - CopilotKit state integration
 """
 
+import json
 import os
-from typing import Literal
+import re
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Literal, Optional
 
 from copilotkit import CopilotKitState
 from langchain.tools import tool
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import SystemMessage, trim_messages
 from langchain_core.runnables import RunnableConfig
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph
@@ -32,6 +36,41 @@ class AgentState(CopilotKitState):
     conversation_summary: str = ""
 
 
+# Mock weather data - in production, call a real weather API
+WEATHER_DATA = {
+    "new york": "Sunny, 72°F (22°C)",
+    "london": "Cloudy, 59°F (15°C)",
+    "tokyo": "Rainy, 68°F (20°C)",
+    "paris": "Partly cloudy, 65°F (18°C)",
+    "sydney": "Clear, 77°F (25°C)",
+}
+
+# Finds a known city anywhere in a free-form location in one pass
+# (longest names first so "new york" wins over any shorter overlap)
+_CITY_PATTERN = re.compile(
+    "|".join(re.escape(city) for city in sorted(WEATHER_DATA, key=len, reverse=True))
+)
+
+
+@lru_cache(maxsize=1024)
+def _lookup_weather(location: str) -> str:
+    """Resolve a location to its weather report (pure, so results are memoized)."""
+    key = location.strip().lower()
+    
+    # Exact city name is the common case
+    weather = WEATHER_DATA.get(key)
+    if weather is None:
+        # Fall back to a city mentioned inside the location, e.g. "London, UK"
+        match = _CITY_PATTERN.search(key)
+        if match:
+            weather = WEATHER_DATA[match.group()]
+    
+    if weather is not None:
+        return f"The weather in {location} is: {weather}"
+    
+    return f"Weather data not available for {location}. Try: New York, London, Tokyo, Paris, or Sydney."
+
+
 @tool
 def get_weather(location: str) -> str:
     """
@@ -43,21 +82,7 @@ def get_weather(location: str) -> str:
     Returns:
         Weather information for the location
     """
-    # Mock weather data - in production, call a real weather API
-    weather_data = {
-        "new york": "Sunny, 72°F (22°C)",
-        "london": "Cloudy, 59°F (15°C)",
-        "tokyo": "Rainy, 68°F (20°C)",
-        "paris": "Partly cloudy, 65°F (18°C)",
-        "sydney": "Clear, 77°F (25°C)",
-    }
-    
-    location_lower = location.lower()
-    for city, weather in weather_data.items():
-        if city in location_lower:
-            return f"The weather in {location} is: {weather}"
-    
-    return f"Weather data not available for {location}. Try: New York, London, Tokyo, Paris, or Sydney."
+    return _lookup_weather(location)
 
 
 @tool
@@ -81,27 +106,157 @@ def get_time(timezone: str = "UTC") -> str:
 tools = [get_weather, get_time]
 
 
-def should_route_to_tool_node(tool_calls, fe_tools) -> bool:
+# System prompt shared by every turn
+SYSTEM_MESSAGE = SystemMessage(
+    content="""You are a helpful assistant with access to tools.
+        
+You can:
+- Check the weather in various cities
+- Tell the current time
+
+Be friendly and conversational. If the user asks about something you can't help with,
+let them know politely.
+
+Remember: You have persistent memory! Previous conversations in this thread are preserved."""
+)
+
+
+@lru_cache(maxsize=1)
+def get_max_context_messages() -> int:
     """
-    Determine if we should route to the tool node.
+    Optional cap on how many recent messages are sent to the model (0 = no cap).
     
-    Returns True if the tool calls are backend tools (not frontend actions).
+    Read lazily so MAX_CONTEXT_MESSAGES from .env is honored (main.py loads
+    .env after importing the workflow).
+    """
+    return int(os.getenv("MAX_CONTEXT_MESSAGES", "0"))
+
+
+def _trim_history(messages: list, max_messages: int) -> list:
+    """
+    Keep roughly the last max_messages messages, starting on a human message.
+    
+    Starting on a human message keeps tool calls paired with their results.
+    If the window contains no human message (e.g. a long tool loop), the
+    latest human message and everything after it are kept instead, so the
+    model never loses the request it is working on.
+    """
+    trimmed = trim_messages(
+        messages,
+        strategy="last",
+        token_counter=len,
+        max_tokens=max_messages,
+        start_on="human",
+    )
+    if trimmed:
+        return trimmed
+    
+    for index in range(len(messages) - 1, -1, -1):
+        if messages[index].type == "human":
+            return messages[index:]
+    return messages
+
+
+def build_prompt(state: AgentState) -> tuple:
+    """
+    Build the model input for a turn.
+    
+    With MAX_CONTEXT_MESSAGES set, only the most recent messages are sent
+    (see _trim_history). Older messages are dropped, not summarized: the
+    agent never writes conversation_summary itself, but if a consumer
+    populates it, it is sent right after the system prompt.
     """
-    if not tool_calls:
-        return False
+    messages = state["messages"]
+    summary = state.get("conversation_summary")
     
-    fe_tool_names = {tool.get("name") for tool in (fe_tools or [])}
+    max_messages = get_max_context_messages()
+    if max_messages and len(messages) > max_messages:
+        messages = _trim_history(messages, max_messages)
     
-    for tool_call in tool_calls:
-        tool_name = (
-            tool_call.get("name")
-            if isinstance(tool_call, dict)
-            else getattr(tool_call, "name", None)
+    if summary:
+        return (
+            SYSTEM_MESSAGE,
+            SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"),
+            *messages,
         )
-        if tool_name in fe_tool_names:
-            return False
+    return (SYSTEM_MESSAGE, *messages)
+
+
+def _create_llm_cache(temperature: float):
+    """
+    Create the LLM response cache configured by LLM_CACHE_URL, if any.
+    
+    Only used with temperature 0, where identical prompts are expected to
+    produce identical responses. LangChain keys entries by the full prompt
+    and model parameters (including bound tools).
     
-    return True
+    - "memory": per-process in-memory cache
+    - "redis://...": shared Redis cache (pip install -e ".[redis]")
+    """
+    cache_url = os.getenv("LLM_CACHE_URL")
+    if not cache_url or temperature != 0:
+        return None
+    
+    if cache_url == "memory":
+        from langchain_core.caches import InMemoryCache
+        
+        return InMemoryCache(maxsize=1024)
+    
+    import redis
+    from langchain_community.cache import RedisCache
+    
+    return RedisCache(redis.Redis.from_url(cache_url), ttl=3600)
+
+
+@lru_cache(maxsize=1)
+def get_model() -> ChatOpenAI:
+    """
+    Get the shared chat model.
+    
+    Built lazily so importing this module doesn't require OPENAI_API_KEY
+    to be set yet (main.py loads .env after importing the workflow).
+    """
+    temperature = float(os.getenv("MODEL_TEMPERATURE", "0.7"))
+    return ChatOpenAI(
+        model="gpt-4o-mini",
+        temperature=temperature,
+        cache=_create_llm_cache(temperature),
+    )
+
+
+@lru_cache(maxsize=64)
+def _bind_tools(fe_tools_key: str):
+    """Bind the frontend tools (serialized as JSON) plus backend tools to the model."""
+    fe_tools = json.loads(fe_tools_key)
+    return get_model().bind_tools([*fe_tools, *tools])
+
+
+def get_model_with_tools(fe_tools: list):
+    """
+    Get the model bound to the given frontend tools and all backend tools.
+    
+    Bindings are cached by the full frontend tool definitions, so the tool
+    schemas are only converted once per distinct set of frontend actions.
+    """
+    return _bind_tools(json.dumps(fe_tools, sort_keys=True))
+
+
+def _tool_call_name(tool_call) -> Optional[str]:
+    """Get the tool name from a tool call dict or object."""
+    if isinstance(tool_call, Mapping):
+        return tool_call.get("name")
+    return getattr(tool_call, "name", None)
+
+
+def should_route_to_tool_node(tool_calls, fe_tool_names: frozenset) -> bool:
+    """
+    Determine if we should route to the tool node.
+    
+    Returns True if the tool calls are backend tools (not frontend actions).
+    """
+    return bool(tool_calls) and not any(
+        _tool_call_name(tool_call) in fe_tool_names for tool_call in tool_calls
+    )
 
 
 async def chat_node(
@@ -116,38 +271,21 @@ async def chat_node(
     3. Generates a response
     4. Routes to tool_node or ends
     """
-    # Initialize the model
-    model = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
-    
     # Get frontend tools from CopilotKit state
     fe_tools = state.get("copilotkit", {}).get("actions", [])
+    fe_tool_names = frozenset(tool.get("name") for tool in fe_tools)
     
-    # Bind all tools to the model
-    model_with_tools = model.bind_tools([*fe_tools, *tools])
-    
-    # Create system message
-    system_message = SystemMessage(
-        content="""You are a helpful assistant with access to tools.
-        
-You can:
-- Check the weather in various cities
-- Tell the current time
-
-Be friendly and conversational. If the user asks about something you can't help with,
-let them know politely.
-
-Remember: You have persistent memory! Previous conversations in this thread are preserved."""
-    )
+    # Get the model with all tools bound (cached per set of frontend tools)
+    model_with_tools = get_model_with_tools(fe_tools)
     
     # Generate response
     response = await model_with_tools.ainvoke(
-        [system_message, *state["messages"]],
+        build_prompt(state),
         config,
     )
     
     # Check if we need to call tools
-    tool_calls = response.tool_calls
-    if tool_calls and should_route_to_tool_node(tool_calls, fe_tools):
+    if should_route_to_tool_node(response.tool_calls, fe_tool_names):
         return Command(goto="tool_node", update={"messages": response})
     
     # No tool calls - end the conversation turn
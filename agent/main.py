@@ -7,25 +7,33 @@ This example demonstrates:
 3. History endpoints for the copilotkit-langgraph-history TypeScript package
 """
 
+import asyncio
 import os
 import sys
 from pathlib import Path
 from contextlib import asynccontextmanager
 
-# Add the parent python package to the path for local development
-python_pkg_path = Path(__file__).parent.parent.parent.parent / "python" / "src"
-if python_pkg_path.exists():
-    sys.path.insert(0, str(python_pkg_path))
+# Add the parent python package to the path for local development.
+# Opt-in (COPILOTKIT_DEV_LOCAL=1 in the shell, .env isn't loaded yet) so
+# deployed servers don't stat the path or search it on every import.
+if os.getenv("COPILOTKIT_DEV_LOCAL") == "1":
+    python_pkg_path = Path(__file__).parent.parent.parent.parent / "python" / "src"
+    if python_pkg_path.exists():
+        sys.path.insert(0, str(python_pkg_path))
 
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 import uvicorn
 
 import asyncpg
 from copilotkit import LangGraphAGUIAgent
 from ag_ui_langgraph import add_langgraph_fastapi_endpoint
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
 
 # Import our history endpoints
 from copilotkit_history import add_history_endpoints
@@ -34,7 +42,12 @@ from copilotkit_history import add_history_endpoints
 from agent import create_workflow
 
 # Import ownership module (consumer-side implementation, NOT part of the library)
-from ownership import create_ownership_router, set_db_pool, setup_ownership_table
+from ownership import (
+    create_ownership_router,
+    init_ownership_connection,
+    set_db_pool,
+    setup_ownership_table,
+)
 
 # Load environment variables
 load_dotenv()
@@ -49,10 +62,102 @@ if not os.getenv("DATABASE_URL"):
 # Get database URL
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Checkpoint backend: "postgres" (default, for multi-node deployments) or
+# "sqlite" (single-node/local, a file next to the server; requires
+# langgraph-checkpoint-sqlite). Thread ownership always uses PostgreSQL.
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "postgres")
+
 # Global reference to the compiled graph (set in lifespan)
 graph = None
 
 
+@asynccontextmanager
+async def open_checkpointer():
+    """Open the checkpointer for the configured CHECKPOINT_BACKEND."""
+    if CHECKPOINT_BACKEND == "sqlite":
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        
+        sqlite_path = os.getenv("SQLITE_CHECKPOINT_PATH", "checkpoints.sqlite")
+        async with AsyncSqliteSaver.from_conn_string(sqlite_path) as checkpointer:
+            yield checkpointer
+    elif CHECKPOINT_BACKEND == "postgres":
+        # A pool instead of from_conn_string's single connection, so graph
+        # steps and history reads don't queue behind each other
+        async with AsyncConnectionPool(
+            DATABASE_URL,
+            min_size=1,
+            max_size=int(os.getenv("CHECKPOINT_POOL_MAX", "10")),
+            # Settings required by AsyncPostgresSaver, plus JIT off since
+            # checkpoint lookups are short indexed queries
+            kwargs={
+                "autocommit": True,
+                "prepare_threshold": 0,
+                "row_factory": dict_row,
+                "options": "-c jit=off",
+            },
+            open=False,
+        ) as pool:
+            yield AsyncPostgresSaver(pool)
+    else:
+        raise ValueError(f"Unsupported CHECKPOINT_BACKEND: {CHECKPOINT_BACKEND}")
+
+
+# Arbitrary application-wide key for pg_advisory_lock
+SCHEMA_SETUP_LOCK_ID = 7_201_514_409
+
+# The advisory lock is session-level, so it must be taken on a direct
+# PostgreSQL connection (not through a transaction-pooling PgBouncer)
+SCHEMA_SETUP_DATABASE_URL = os.getenv("SCHEMA_SETUP_DATABASE_URL", DATABASE_URL)
+
+
+@asynccontextmanager
+async def schema_setup_lock():
+    """
+    Hold a PostgreSQL advisory lock while creating tables and running migrations.
+    
+    Every uvicorn worker runs the lifespan, so on a fresh database several
+    processes would otherwise race on CREATE TABLE and checkpoint migrations.
+    """
+    conn = await asyncpg.connect(SCHEMA_SETUP_DATABASE_URL)
+    try:
+        await conn.execute("SELECT pg_advisory_lock($1)", SCHEMA_SETUP_LOCK_ID)
+        try:
+            # The connection has no command_timeout, so it is also used to
+            # run the (possibly slow) ownership DDL
+            yield conn
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", SCHEMA_SETUP_LOCK_ID)
+    finally:
+        await conn.close()
+
+
+async def create_ownership_pool() -> asyncpg.Pool:
+    """Create the connection pool for the ownership table."""
+    # Separate from the checkpointer to demonstrate the consumer pattern
+    ownership_pool = await asyncpg.create_pool(
+        DATABASE_URL,
+        min_size=2,
+        max_size=int(os.getenv("PG_POOL_MAX", "20")),
+        max_inactive_connection_lifetime=300,
+        # Set PG_STATEMENT_CACHE_SIZE=0 behind a transaction-pooling PgBouncer
+        # that doesn't track prepared statements (see README)
+        statement_cache_size=int(os.getenv("PG_STATEMENT_CACHE_SIZE", "1024")),
+        command_timeout=10,
+        # JIT only adds overhead to the short ownership lookups
+        server_settings={"jit": "off"},
+        init=init_ownership_connection,
+    )
+    set_db_pool(ownership_pool)
+    return ownership_pool
+
+
+async def _cancel_and_wait(*tasks: asyncio.Task):
+    """Cancel tasks and wait until they have actually finished."""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -65,45 +170,72 @@ async def lifespan(app: FastAPI):
     
     print("🔧 Setting up PostgreSQL connections...")
     
-    # Create a connection pool for ownership table
-    # (separate from checkpointer to demonstrate consumer pattern)
-    ownership_pool = await asyncpg.create_pool(DATABASE_URL)
-    set_db_pool(ownership_pool)
-    
-    # Setup the ownership table (consumer's responsibility)
-    await setup_ownership_table(ownership_pool)
+    ownership_pool = None
     
-    async with AsyncPostgresSaver.from_conn_string(DATABASE_URL) as checkpointer:
-        # Setup creates the required tables if they don't exist
-        await checkpointer.setup()
-        print("✅ Checkpointer tables ready!")
-        
-        # Create the workflow and compile with checkpointer
-        workflow = create_workflow()
-        graph = workflow.compile(checkpointer=checkpointer)
-        print("✅ Graph compiled with PostgreSQL persistence!")
-        
-        # Add the AG-UI endpoint for CopilotKit
-        add_langgraph_fastapi_endpoint(
-            app=app,
-            agent=LangGraphAGUIAgent(
-                name="history_agent",
-                description="An agent with persistent thread history support.",
-                graph=graph,
-            ),
-            path="/",
-        )
-        print("✅ AG-UI endpoint registered!")
-        
-        # Add history endpoints for thread persistence
-        # This is the key integration with copilotkit-langgraph-history!
-        add_history_endpoints(app, graph)
-        print("✅ History endpoints registered!")
-        
-        yield
-        
-        print("🔒 Shutting down PostgreSQL connections...")
-        await ownership_pool.close()
+    try:
+        async with open_checkpointer() as checkpointer:
+            # Connect the ownership pool while the schema lock is acquired
+            pool_task = asyncio.create_task(create_ownership_pool())
+            try:
+                # Only one worker at a time creates tables / runs migrations
+                async with schema_setup_lock() as schema_conn:
+                    ownership_pool = await pool_task
+                    
+                    # The ownership table and the checkpointer are independent,
+                    # so they are set up concurrently.
+                    # Setup creates the required tables if they don't exist.
+                    setup_tasks = (
+                        asyncio.create_task(checkpointer.setup()),
+                        asyncio.create_task(
+                            setup_ownership_table(ownership_pool, schema_conn)
+                        ),
+                    )
+                    try:
+                        await asyncio.gather(*setup_tasks)
+                    except BaseException:
+                        # Stop the other setup before its connections are closed
+                        await _cancel_and_wait(*setup_tasks)
+                        raise
+            except BaseException:
+                # Close the pool if it was created but not yet handed over
+                await _cancel_and_wait(pool_task)
+                if (
+                    ownership_pool is None
+                    and not pool_task.cancelled()
+                    and pool_task.exception() is None
+                ):
+                    await pool_task.result().close()
+                raise
+            print(f"✅ Checkpointer tables ready ({CHECKPOINT_BACKEND})!")
+            
+            # Create the workflow and compile with checkpointer
+            workflow = create_workflow()
+            graph = workflow.compile(checkpointer=checkpointer)
+            print(f"✅ Graph compiled with {CHECKPOINT_BACKEND} persistence!")
+            
+            # Add the AG-UI endpoint for CopilotKit
+            add_langgraph_fastapi_endpoint(
+                app=app,
+                agent=LangGraphAGUIAgent(
+                    name="history_agent",
+                    description="An agent with persistent thread history support.",
+                    graph=graph,
+                ),
+                path="/",
+            )
+            print("✅ AG-UI endpoint registered!")
+            
+            # Add history endpoints for thread persistence
+            # This is the key integration with copilotkit-langgraph-history!
+            add_history_endpoints(app, graph)
+            print("✅ History endpoints registered!")
+            
+            yield
+            
+            print("🔒 Shutting down PostgreSQL connections...")
+    finally:
+        if ownership_pool is not None:
+            await ownership_pool.close()
 
 
 # Create FastAPI app with lifespan
@@ -112,6 +244,8 @@ app = FastAPI(
     description="Example FastAPI agent with persistent thread history",
     version="0.1.0",
     lifespan=lifespan,
+    # orjson is much faster than stdlib json for large history payloads
+    default_response_class=ORJSONResponse,
 )
 
 # Add CORS middleware for local development
@@ -123,6 +257,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON responses such as /threads/{thread_id}/history
+# Starlette >= 0.46 (pinned in pyproject.toml) leaves text/event-stream
+# responses uncompressed, so the AG-UI streams at / and /runs/{run_id}/join
+# are not buffered
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 
 # Add ownership endpoints (consumer-side implementation)
 # This demonstrates how consumers layer ownership ON TOP of the library
@@ -150,11 +290,29 @@ def main():
     print(f"   GET  http://localhost:{port}/users/{{user_id}}/threads")
     print(f"   POST http://localhost:{port}/users/{{user_id}}/threads\n")
     
+    # uvloop + httptools come from uvicorn[standard]. loop="auto" picks uvloop
+    # when installed and falls back to asyncio where it isn't available
+    # (Windows, Cygwin, PyPy). The reloader is opt-in because it runs the
+    # app under an extra supervisor process.
+    reload = os.getenv("AGENT_RELOAD") == "1"
+    
+    # SQLite checkpoints are meant for a single process on a single node
+    default_workers = 1 if CHECKPOINT_BACKEND == "sqlite" else os.cpu_count() or 1
+    
+    # One worker process per core by default. Each worker runs its own lifespan,
+    # so it gets its own ownership pool, checkpointer pool and graph.
+    # The reloader only supports a single process.
+    workers = 1 if reload else int(os.getenv("WEB_CONCURRENCY", default_workers))
+    print(f"⚙️  Workers: {workers}\n")
+    
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=port,
-        reload=True,
+        loop="auto",
+        http="httptools",
+        reload=reload,
+        workers=workers,
     )
 
 
@@ -10,9 +10,12 @@ Key points:
 - Uses PostgreSQL for persistence (same DB as checkpoints)
 """
 
+import asyncio
 from datetime import datetime
 from typing import Optional
-from fastapi import APIRouter, HTTPException, Depends
+from cachetools import TTLCache
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 import asyncpg
 
@@ -34,6 +37,22 @@ def get_db_pool() -> asyncpg.Pool:
     return _pool
 
 
+# Seconds to wait for a free pool connection before failing the request
+POOL_ACQUIRE_TIMEOUT = 2
+
+
+async def get_db_conn():
+    """
+    FastAPI dependency yielding a pooled connection for the request.
+    
+    The connection is released back to the pool when the request finishes.
+    get_db_pool() is called directly rather than via Depends: it is a sync
+    function, which FastAPI would run in the thread pool on every request.
+    """
+    async with get_db_pool().acquire(timeout=POOL_ACQUIRE_TIMEOUT) as conn:
+        yield conn
+
+
 # DDL for thread ownership table
 OWNERSHIP_TABLE_DDL = """
 CREATE TABLE IF NOT EXISTS thread_ownership (
@@ -43,28 +62,166 @@ CREATE TABLE IF NOT EXISTS thread_ownership (
     created_at   TIMESTAMP DEFAULT NOW()
 );
 
-CREATE INDEX IF NOT EXISTS idx_thread_ownership_user 
-ON thread_ownership(user_id, created_at DESC);
+-- Covering index so listing a user's threads is an index-only scan.
+-- thread_id breaks ties between equal created_at values, keeping pages stable.
+-- Replaces the earlier non-covering idx_thread_ownership_user.
+CREATE INDEX IF NOT EXISTS idx_thread_ownership_user_recent
+ON thread_ownership(user_id, created_at DESC, thread_id DESC)
+INCLUDE (title);
+
+DROP INDEX IF EXISTS idx_thread_ownership_user;
 """
 
 
-async def setup_ownership_table(pool: asyncpg.Pool):
+# Queries used by the ownership endpoints. asyncpg caches prepared statements
+# per connection keyed by query text, so every call site must use these.
+SELECT_OWNER_SQL = "SELECT user_id FROM thread_ownership WHERE thread_id = $1"
+
+LIST_USER_THREADS_SQL = """
+SELECT thread_id, user_id, title, created_at
+FROM thread_ownership
+WHERE user_id = $1
+ORDER BY created_at DESC, thread_id DESC
+LIMIT $2 OFFSET $3
+"""
+
+SELECT_THREAD_SQL = """
+SELECT thread_id, user_id, title, created_at
+FROM thread_ownership
+WHERE thread_id = $1
+"""
+
+# created_at comes from the column default
+CREATE_THREAD_SQL = """
+INSERT INTO thread_ownership (thread_id, user_id, title)
+VALUES ($1, $2, $3)
+ON CONFLICT (thread_id) DO NOTHING
+RETURNING thread_id, user_id, title, created_at
+"""
+
+DELETE_THREAD_SQL = """
+DELETE FROM thread_ownership
+WHERE thread_id = $1 AND user_id = $2
+RETURNING 1
+"""
+
+UPDATE_TITLE_SQL = """
+UPDATE thread_ownership SET title = $1
+WHERE thread_id = $2 AND user_id = $3
+RETURNING created_at
+"""
+
+# Read-only queries (with harmless arguments) run once per new connection
+# to populate its statement cache. Writes get cached on first use instead,
+# since asyncpg only caches statements it has executed.
+_WARMUP_QUERIES = (
+    (SELECT_OWNER_SQL, ("",)),
+    (LIST_USER_THREADS_SQL, ("", 1, 0)),
+)
+
+
+async def init_ownership_connection(conn: asyncpg.Connection):
+    """
+    Warm the statement cache of a new pool connection.
+    
+    Pass this as ``init=`` to ``asyncpg.create_pool``.
+    """
+    try:
+        for query, args in _WARMUP_QUERIES:
+            await conn.fetch(query, *args)
+    except asyncpg.UndefinedTableError:
+        # First startup: the table is created (and the pool re-warmed)
+        # by setup_ownership_table
+        pass
+
+
+async def setup_ownership_table(pool: asyncpg.Pool, conn: asyncpg.Connection):
     """
     Create the thread_ownership table if it doesn't exist.
     
-    Call this during application startup.
+    Call this during application startup. The DDL runs on ``conn``, which
+    should have no command_timeout: building the index on an existing large
+    table can take longer than the pool's per-query timeout.
     """
-    async with pool.acquire() as conn:
-        await conn.execute(OWNERSHIP_TABLE_DDL)
+    await conn.execute(OWNERSHIP_TABLE_DDL)
+    # Refresh planner statistics so the covering index gets picked up
+    await conn.execute("ANALYZE thread_ownership")
+    
+    # Reconnect idle connections so init_ownership_connection runs
+    # again now that the table exists
+    await pool.expire_connections()
     print("✅ Thread ownership table ready!")
 
 
+# In-process cache of thread_id -> owner user_id for the ownership checks.
+# Only registered threads are cached, so a thread created through another
+# worker is never hidden behind a stale "no owner" entry. The TTL bounds
+# how long a delete made by another worker can go unnoticed.
+_owner_cache: TTLCache = TTLCache(maxsize=100_000, ttl=300)
+
+
+class _OwnerLock:
+    """Lock for one thread_id plus the number of callers holding or awaiting it."""
+    
+    __slots__ = ("lock", "users")
+    
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+# Per-thread locks so concurrent misses for the same thread share one query.
+# An entry is removed once its last user is done, so the dict only holds
+# threads with a lookup in flight.
+_owner_locks: dict[str, _OwnerLock] = {}
+
+
+async def _get_owner(thread_id: str) -> Optional[str]:
+    """Look up a thread's owner, serving repeat lookups from the cache."""
+    owner = _owner_cache.get(thread_id)
+    if owner is not None:
+        return owner
+    
+    entry = _owner_locks.get(thread_id)
+    if entry is None:
+        entry = _owner_locks[thread_id] = _OwnerLock()
+    entry.users += 1
+    try:
+        async with entry.lock:
+            owner = _owner_cache.get(thread_id)
+            if owner is None:
+                async with get_db_pool().acquire(timeout=POOL_ACQUIRE_TIMEOUT) as conn:
+                    owner = await conn.fetchval(SELECT_OWNER_SQL, thread_id)
+                if owner is not None:
+                    _owner_cache[thread_id] = owner
+    finally:
+        # Also runs on timeouts/DB errors so failed lookups don't leak locks
+        entry.users -= 1
+        if entry.users == 0:
+            del _owner_locks[thread_id]
+    return owner
+
+
+async def _raise_not_found_or_forbidden(
+    conn: asyncpg.Connection, thread_id: str, forbidden_detail: str
+):
+    """
+    Explain why an ownership-guarded write matched no rows.
+    
+    Only runs on the rare miss path, so the common case stays a single query.
+    """
+    owner = await conn.fetchval(SELECT_OWNER_SQL, thread_id)
+    if owner is None:
+        raise HTTPException(status_code=404, detail="Thread not found")
+    raise HTTPException(status_code=403, detail=forbidden_detail)
+
+
 class ThreadInfo(BaseModel):
     """Thread information with ownership."""
     thread_id: str
     user_id: str
     title: Optional[str] = None
-    created_at: str
+    created_at: Optional[datetime] = None
 
 
 class CreateThreadRequest(BaseModel):
@@ -78,7 +235,7 @@ class CreateThreadResponse(BaseModel):
     thread_id: str
     user_id: str
     title: Optional[str]
-    created_at: str
+    created_at: Optional[datetime]
 
 
 def create_ownership_router() -> APIRouter:
@@ -91,114 +248,88 @@ def create_ownership_router() -> APIRouter:
     router = APIRouter(tags=["Ownership"])
     
     @router.get("/users/{user_id}/threads", response_model=list[ThreadInfo])
-    async def list_user_threads(user_id: str):
+    async def list_user_threads(
+        user_id: str,
+        limit: int = Query(50, ge=1, le=200),
+        offset: int = Query(0, ge=0),
+        conn: asyncpg.Connection = Depends(get_db_conn),
+    ):
         """
-        List all threads owned by a user.
+        List threads owned by a user, most recent first.
         
         This is the key endpoint that enables thread persistence
         across different browsers/devices for the same user.
+        Use limit/offset to page through users with many threads.
         """
-        pool = get_db_pool()
-        async with pool.acquire() as conn:
-            rows = await conn.fetch(
-                """
-                SELECT thread_id, user_id, title, created_at
-                FROM thread_ownership
-                WHERE user_id = $1
-                ORDER BY created_at DESC
-                """,
-                user_id
-            )
-            return [
-                ThreadInfo(
-                    thread_id=row["thread_id"],
-                    user_id=row["user_id"],
-                    title=row["title"],
-                    created_at=row["created_at"].isoformat() if row["created_at"] else None,
-                )
-                for row in rows
-            ]
+        rows = await conn.fetch(LIST_USER_THREADS_SQL, user_id, limit, offset)
+        # The query already returns exactly the ThreadInfo fields, so skip
+        # per-row model validation and serialize the records directly.
+        # response_model still documents the shape in the OpenAPI schema.
+        return ORJSONResponse([dict(row) for row in rows])
     
     @router.post("/users/{user_id}/threads", response_model=CreateThreadResponse)
-    async def create_user_thread(user_id: str, request: CreateThreadRequest):
+    async def create_user_thread(
+        user_id: str,
+        request: CreateThreadRequest,
+        conn: asyncpg.Connection = Depends(get_db_conn),
+    ):
         """
         Create a new thread owned by a user.
         
         This registers ownership of a thread before any messages are sent.
         """
-        pool = get_db_pool()
         thread_id = request.thread_id
         title = request.title or f"Thread {thread_id[:8]}..."
         
-        async with pool.acquire() as conn:
-            # Check if thread already exists
-            existing = await conn.fetchrow(
-                "SELECT thread_id, user_id, title, created_at FROM thread_ownership WHERE thread_id = $1",
-                thread_id
-            )
-            
-            if existing:
-                if existing["user_id"] != user_id:
-                    raise HTTPException(
-                        status_code=403,
-                        detail="Thread already owned by another user"
-                    )
-                # Return existing thread info
-                return CreateThreadResponse(
-                    thread_id=existing["thread_id"],
-                    user_id=existing["user_id"],
-                    title=existing["title"],
-                    created_at=existing["created_at"].isoformat(),
-                )
-            
-            # Create new thread ownership
-            now = datetime.utcnow()
-            await conn.execute(
-                """
-                INSERT INTO thread_ownership (thread_id, user_id, title, created_at)
-                VALUES ($1, $2, $3, $4)
-                """,
-                thread_id, user_id, title, now
+        # New threads take a single round-trip. On conflict nothing is
+        # written and the existing row is read back instead.
+        row = await conn.fetchrow(CREATE_THREAD_SQL, thread_id, user_id, title)
+        if row is None:
+            row = await conn.fetchrow(SELECT_THREAD_SQL, thread_id)
+        if row is None:
+            # Deleted between the insert and the lookup
+            raise HTTPException(
+                status_code=409,
+                detail="Thread was modified concurrently, please retry"
             )
-            
-            return CreateThreadResponse(
-                thread_id=thread_id,
-                user_id=user_id,
-                title=title,
-                created_at=now.isoformat(),
+        
+        _owner_cache[thread_id] = row["user_id"]
+        
+        if row["user_id"] != user_id:
+            raise HTTPException(
+                status_code=403,
+                detail="Thread already owned by another user"
             )
+        
+        return CreateThreadResponse(
+            thread_id=row["thread_id"],
+            user_id=row["user_id"],
+            title=row["title"],
+            created_at=row["created_at"],
+        )
     
     @router.delete("/users/{user_id}/threads/{thread_id}")
-    async def delete_user_thread(user_id: str, thread_id: str):
+    async def delete_user_thread(
+        user_id: str,
+        thread_id: str,
+        conn: asyncpg.Connection = Depends(get_db_conn),
+    ):
         """
         Delete a thread (ownership record only).
         
         This removes the ownership record but does NOT delete
         the actual checkpoint data from PostgreSQL.
         """
-        pool = get_db_pool()
-        async with pool.acquire() as conn:
-            # Check ownership first
-            existing = await conn.fetchrow(
-                "SELECT user_id FROM thread_ownership WHERE thread_id = $1",
-                thread_id
-            )
-            
-            if not existing:
-                raise HTTPException(status_code=404, detail="Thread not found")
-            
-            if existing["user_id"] != user_id:
-                raise HTTPException(
-                    status_code=403,
-                    detail="Cannot delete thread owned by another user"
-                )
-            
-            await conn.execute(
-                "DELETE FROM thread_ownership WHERE thread_id = $1",
-                thread_id
+        # Ownership is enforced by the WHERE clause
+        deleted = await conn.fetchval(DELETE_THREAD_SQL, thread_id, user_id)
+        _owner_cache.pop(thread_id, None)
+        
+        if not deleted:
+            await _raise_not_found_or_forbidden(
+                conn, thread_id, "Cannot delete thread owned by another user"
             )
-            
-            return {"status": "deleted", "thread_id": thread_id}
+        
+        return {"status": "deleted", "thread_id": thread_id}
     
     @router.get("/threads/{thread_id}/owner")
     async def get_thread_owner(thread_id: str):
@@ -207,51 +338,33 @@ def create_ownership_router() -> APIRouter:
         
         Useful for verifying ownership before accessing thread data.
         """
-        pool = get_db_pool()
-        async with pool.acquire() as conn:
-            row = await conn.fetchrow(
-                "SELECT user_id FROM thread_ownership WHERE thread_id = $1",
-                thread_id
-            )
-            
-            if not row:
-                return {"thread_id": thread_id, "owner": None}
-            
-            return {"thread_id": thread_id, "owner": row["user_id"]}
+        owner = await _get_owner(thread_id)
+        return {"thread_id": thread_id, "owner": owner}
     
     @router.patch("/users/{user_id}/threads/{thread_id}")
-    async def update_thread_title(user_id: str, thread_id: str, title: str):
+    async def update_thread_title(
+        user_id: str,
+        thread_id: str,
+        title: str,
+        conn: asyncpg.Connection = Depends(get_db_conn),
+    ):
         """
         Update a thread's title.
         """
-        pool = get_db_pool()
-        async with pool.acquire() as conn:
-            # Check ownership first
-            existing = await conn.fetchrow(
-                "SELECT user_id, title, created_at FROM thread_ownership WHERE thread_id = $1",
-                thread_id
-            )
-            
-            if not existing:
-                raise HTTPException(status_code=404, detail="Thread not found")
-            
-            if existing["user_id"] != user_id:
-                raise HTTPException(
-                    status_code=403,
-                    detail="Cannot update thread owned by another user"
-                )
-            
-            await conn.execute(
-                "UPDATE thread_ownership SET title = $1 WHERE thread_id = $2",
-                title, thread_id
-            )
-            
-            return ThreadInfo(
-                thread_id=thread_id,
-                user_id=user_id,
-                title=title,
-                created_at=existing["created_at"].isoformat(),
+        # Ownership is enforced by the WHERE clause
+        row = await conn.fetchrow(UPDATE_TITLE_SQL, title, thread_id, user_id)
+        
+        if not row:
+            await _raise_not_found_or_forbidden(
+                conn, thread_id, "Cannot update thread owned by another user"
             )
+        
+        return ThreadInfo(
+            thread_id=thread_id,
+            user_id=user_id,
+            title=title,
+            created_at=row["created_at"],
+        )
     
     return router
 
@@ -270,15 +383,10 @@ async def verify_thread_ownership(user_id: str, thread_id: str) -> bool:
             # Now call the library endpoint
             return await library_get_history(thread_id)
     """
-    pool = get_db_pool()
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            "SELECT user_id FROM thread_ownership WHERE thread_id = $1",
-            thread_id
-        )
-        
-        if not row:
-            # Thread not registered - could be a new thread or legacy
-            return True  # Allow access (consumer can make this stricter)
-        
-        return row["user_id"] == user_id
+    owner = await _get_owner(thread_id)
+    
+    if owner is None:
+        # Thread not registered - could be a new thread or legacy
+        return True  # Allow access (consumer can make this stricter)
+    
+    return owner == user_id
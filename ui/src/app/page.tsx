@@ -15,6 +15,9 @@ const SAMPLE_USERS = [
 
 const AGENT_URL = process.env.NEXT_PUBLIC_AGENT_URL || "http://localhost:8123";
 
+// Page size when listing threads (the server caps limit at 200)
+const THREADS_PAGE_SIZE = 200;
+
 interface ThreadInfo {
   thread_id: string;
   user_id: string;
@@ -31,6 +34,22 @@ function getThreadIdFromUrl(): string | null {
   return params.get("threadId");
 }
 
+/**
+ * Fetch all of a user's threads (most recent first), one page at a time
+ */
+async function fetchAllThreads(userId: string): Promise<ThreadInfo[] | null> {
+  const threads: ThreadInfo[] = [];
+  for (let offset = 0; ; offset += THREADS_PAGE_SIZE) {
+    const response = await fetch(
+      `${AGENT_URL}/users/${userId}/threads?limit=${THREADS_PAGE_SIZE}&offset=${offset}`
+    );
+    if (!response.ok) return null;
+    const page: ThreadInfo[] = await response.json();
+    threads.push(...page);
+    if (page.length < THREADS_PAGE_SIZE) return threads;
+  }
+}
+
 /**
  * User Selector Component - Simulates login
  */
@@ -166,9 +185,8 @@ export default function Home() {
   const fetchThreads = useCallback(async (userId: string) => {
     setLoading(true);
     try {
-      const response = await fetch(`${AGENT_URL}/users/${userId}/threads`);
-      if (response.ok) {
-        const data = await response.json();
+      const data = await fetchAllThreads(userId);
+      if (data) {
         setThreads(data);
         
         // Check URL for threadId parameter